@@ -1,19 +1,25 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+import asyncio
 import logging
+import os
 
 from app.services.ocr_service import ocr_service
+from app.utils.responses import MsgspecJSONResponse
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1/ocr", tags=["OCR"])
 
+# OCR is CPU-bound; cap the number of documents processed at once
+OCR_SEM = asyncio.Semaphore(int(os.getenv("OCR_MAX_CONCURRENCY", str(os.cpu_count() or 1))))
+
 
 class DocumentRequest(BaseModel):
     url: str
 
 
-@router.post("/process")
+@router.post("/process", response_class=MsgspecJSONResponse)
 async def process_document(request: DocumentRequest):  
     """
     Process a document (image or PDF) from URL using advanced OCR
@@ -21,15 +27,18 @@ async def process_document(request: DocumentRequest):
     try:
         logger.info(f"Processing document from URL: {request.url}")
         
-        result = await ocr_service.process_document_from_url(request.url)
+        async with OCR_SEM:
+            result = await ocr_service.process_document_from_url(request.url)
         
-        if not result.get("success", False):
+        # Successful results are DocumentResult structs; failures are plain error dicts
+        if isinstance(result, dict):
             raise HTTPException(
                 status_code=422, 
                 detail=f"OCR processing failed: {result.get('error', 'Unknown error')}"
             )
         
-        return result
+        # Hand the struct straight to msgspec, bypassing FastAPI's jsonable_encoder
+        return MsgspecJSONResponse(result)
         
     except HTTPException:
         raise
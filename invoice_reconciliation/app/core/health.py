@@ -1,7 +1,7 @@
 # app/core/health.py
+import asyncio
 from app.db.mongodb import get_db
 from app.utils.active_llm import ACTIVE_LLM
-import asyncio
 
 
 async def check_database() -> str:
@@ -27,6 +27,7 @@ async def check_llm(test_prompt: str = "ping") -> str:
     if not ACTIVE_LLM.llm:
         return "not initialized"
     try:
+        # Overall cap: invoke's retries and backoff would otherwise hold the health check far longer
         response = await asyncio.wait_for(ACTIVE_LLM.invoke(test_prompt), timeout=5)
         if response:
             return {
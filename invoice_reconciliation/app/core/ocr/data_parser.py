@@ -1,60 +1,117 @@
 import re
+import string
 import logging
+import numpy as np
 from typing import Dict, List, Any
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    # Linear-time DFA matching; the key patterns use no backreferences
+    import re2 as _re
+except ImportError:
+    _re = re
+
 logger = logging.getLogger(__name__)
 
+# Common key patterns
+KEY_PATTERNS = [
+    r'(?:invoice|bill)\s*(?:no|number|#)',
+    r'(?:date|dated)',
+    r'(?:gst|gstin)\s*(?:no|number)?',
+    r'(?:pan|pan\s*no)',
+    r'(?:vendor|supplier|company)\s*(?:name)?',
+    r'(?:total|grand\s*total|final\s*amount)',
+    r'(?:quantity|qty)',
+    r'(?:rate|price|amount)',
+    r'(?:hsn|sac)',
+    r'(?:cgst|sgst|igst)',
+    r'(?:taxable|tax)\s*(?:amount|value)',
+    r'(?:description|particulars|item)'
+]
 
-def group_words_into_lines(words_data: List[Dict]) -> List[List[Dict]]:
-    """Group words into lines based on vertical positioning"""
-    if not words_data:
+# Single precompiled alternation so each key is scanned once instead of once per pattern.
+# The inline (?i) flag is understood by both re and re2.
+KEY_RE = _re.compile("(?i)" + "|".join(f"(?:{p})" for p in KEY_PATTERNS))
+
+# Keyword stems behind KEY_PATTERNS. Simple stems match a pattern on their own;
+# compound stems (e.g. "invoice" needs "no"/"number"/"#") are confirmed with KEY_RE.
+SIMPLE_KEY_STEMS = [
+    'date', 'gst', 'pan', 'vendor', 'supplier', 'company', 'total', 'quantity', 'qty',
+    'rate', 'price', 'amount', 'hsn', 'sac', 'description', 'particulars', 'item'
+]
+COMPOUND_KEY_STEMS = ['invoice', 'bill', 'tax']
+
+
+def _build_key_automaton():
+    """Build an Aho-Corasick automaton over the key stems, if pyahocorasick is available"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for stem in SIMPLE_KEY_STEMS:
+        automaton.add_word(stem, False)
+    for stem in COMPOUND_KEY_STEMS:
+        automaton.add_word(stem, True)
+    automaton.make_automaton()
+    return automaton
+
+
+KEY_AUTOMATON = _build_key_automaton()
+
+# Words that mark a table header row
+HEADER_TOKENS = frozenset({
+    'description', 'qty', 'rate', 'amount', 'hsn', 'total', 'particulars', 'item', 'quantity'
+})
+
+
+def is_known_key(key: str) -> bool:
+    """Check whether a lower-cased key matches any of the invoice key patterns"""
+    if KEY_AUTOMATON is None:
+        return KEY_RE.search(key) is not None
+
+    # Scan all stems in a single pass; only compound stems need the regex
+    needs_regex = False
+    for _, is_compound in KEY_AUTOMATON.iter(key):
+        if not is_compound:
+            return True
+        needs_regex = True
+    return needs_regex and KEY_RE.search(key) is not None
+
+
+def group_word_indices_into_lines(tops: np.ndarray, lefts: np.ndarray) -> List[np.ndarray]:
+    """Group word indices into lines from top/left coordinate arrays"""
+    if len(tops) == 0:
         return []
-        
-    # Sort words by vertical position
-    sorted_words = sorted(words_data, key=lambda x: x['bbox']['top'])
     
-    lines = []
-    current_line = [sorted_words[0]]
     line_tolerance = 10  # pixels
     
-    for word in sorted_words[1:]:
-        # Check if word is on the same line
-        if abs(word['bbox']['top'] - current_line[-1]['bbox']['top']) <= line_tolerance:
-            current_line.append(word)
-        else:
-            # Sort current line by horizontal position
-            current_line.sort(key=lambda x: x['bbox']['left'])
-            lines.append(current_line)
-            current_line = [word]
+    # Sort words by vertical position and start a new line wherever the gap exceeds the tolerance
+    order = np.argsort(tops, kind='stable')
+    breaks = np.flatnonzero(np.diff(tops[order]) > line_tolerance) + 1
+    
+    # Sort each line by horizontal position
+    return [group[np.argsort(lefts[group], kind='stable')] for group in np.split(order, breaks)]
+
+
+def group_words_into_lines(words_data: List[Dict]) -> List[List[Dict]]:
+    """Group words into lines based on vertical positioning"""
+    if not words_data:
+        return []
     
-    # Add the last line
-    if current_line:
-        current_line.sort(key=lambda x: x['bbox']['left'])
-        lines.append(current_line)
+    n_words = len(words_data)
+    tops = np.fromiter((w['bbox']['top'] for w in words_data), dtype=np.int32, count=n_words)
+    lefts = np.fromiter((w['bbox']['left'] for w in words_data), dtype=np.int32, count=n_words)
     
-    return lines
+    return [[words_data[i] for i in group] for group in group_word_indices_into_lines(tops, lefts)]
 
 
 def extract_kv_pairs_from_lines(lines: List[List[Dict]]) -> Dict[str, str]:
     """Extract key-value pairs from grouped lines using proven patterns"""
     key_value_pairs = {}
     
-    # Common key patterns
-    key_patterns = [
-        r'(?:invoice|bill)\s*(?:no|number|#)',
-        r'(?:date|dated)',
-        r'(?:gst|gstin)\s*(?:no|number)?',
-        r'(?:pan|pan\s*no)',
-        r'(?:vendor|supplier|company)\s*(?:name)?',
-        r'(?:total|grand\s*total|final\s*amount)',
-        r'(?:quantity|qty)',
-        r'(?:rate|price|amount)',
-        r'(?:hsn|sac)',
-        r'(?:cgst|sgst|igst)',
-        r'(?:taxable|tax)\s*(?:amount|value)',
-        r'(?:description|particulars|item)'
-    ]
-    
     for line in lines:
         if len(line) < 2:
             continue
@@ -70,29 +127,24 @@ def extract_kv_pairs_from_lines(lines: List[List[Dict]]) -> Dict[str, str]:
                 value = parts[1].strip()
                 
                 # Check against patterns or add if reasonable
-                for pattern in key_patterns:
-                    if re.search(pattern, key, re.IGNORECASE):
-                        key_value_pairs[key] = value
-                        break
-                else:
-                    # Add if it looks reasonable
-                    if len(key) > 2 and len(key) < 50 and len(value) > 0 and len(value) < 200:
-                        key_value_pairs[key] = value
+                if is_known_key(key):
+                    key_value_pairs[key] = value
+                elif len(key) > 2 and len(key) < 50 and len(value) > 0 and len(value) < 200:
+                    key_value_pairs[key] = value
         
         # Look for label-value patterns (adjacent words)
         elif len(line) >= 2:
             for i in range(len(line) - 1):
-                key_word = line[i]['text'].lower()
-                value_word = line[i + 1]['text']
+                key_word = line[i]['text_lc']
                 
                 # Check if key matches patterns
-                for pattern in key_patterns:
-                    if re.search(pattern, key_word, re.IGNORECASE):
-                        # Check proximity
-                        distance = line[i + 1]['bbox']['left'] - (line[i]['bbox']['left'] + line[i]['bbox']['width'])
-                        if distance < 100:  # Within 100 pixels
-                            key_value_pairs[key_word] = value_word
-                        break
+                if is_known_key(key_word):
+                    # Check proximity
+                    key_bbox = line[i]['bbox']
+                    key_right = key_bbox['left'] + key_bbox['width']
+                    distance = line[i + 1]['bbox']['left'] - key_right
+                    if distance < 100:  # Within 100 pixels
+                        key_value_pairs[key_word] = line[i + 1]['text']
     
     return key_value_pairs
 
@@ -122,8 +174,7 @@ def extract_table_structure_advanced(lines: List[List[Dict]]) -> List[List[str]]
     for line_idx, line in enumerate(lines):
         if len(line) >= 3:  # Potential table row
             line_text = [word['text'] for word in line]
-            if any(keyword in ' '.join(line_text).lower() for keyword in 
-                ['description', 'qty', 'rate', 'amount', 'hsn', 'total', 'particulars', 'item', 'quantity']):
+            if any(word['text_lc'].strip(string.punctuation) in HEADER_TOKENS for word in line):
                 header_row = line_text
                 continue
             table_rows.append(line_text)
@@ -1,151 +1,293 @@
 import cv2
 import numpy as np
-import requests
+import asyncio
+from aiolimiter import AsyncLimiter
 import io
-from PIL import Image, ImageEnhance, ImageFilter
-import base64
+from PIL import Image
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import tempfile
 import os
+import threading
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import ExitStack
 import fitz  # PyMuPDF for PDF processing
+from app.utils.http import get_http_client
+
+try:
+    # SIMD base64 codec with the same API as the stdlib module
+    import pybase64 as _b64
+except ImportError:
+    import base64 as _b64
 
 logger = logging.getLogger(__name__)
 
+# Target long-edge size in pixels for rasterized PDF pages
+OCR_TARGET_LONG_EDGE_PX = int(os.getenv('OCR_TARGET_LONG_EDGE_PX', '1800'))
+MAX_PDF_RENDER_SCALE = 2.0
+# Larger images are downscaled before OCR; Tesseract gains nothing past ~300 DPI and slows down superlinearly
+OCR_MAX_LONG_EDGE_PX = int(os.getenv('OCR_MAX_LONG_EDGE_PX', '2200'))
+# Pages whose text layer has at least this many characters are read directly instead of OCR'd
+OCR_NATIVE_TEXT_MIN_CHARS = int(os.getenv('OCR_NATIVE_TEXT_MIN_CHARS', '200'))
+# Pages per render task; each task parses the document once for its whole run of pages
+PDF_RENDER_CHUNK_PAGES = int(os.getenv('OCR_PDF_RENDER_CHUNK', '4'))
+# Rasterized PDF pages don't need lossless previews
+PDF_PAGE_IMAGE_FORMAT = 'JPEG'
+PDF_PAGE_JPEG_QUALITY = int(os.getenv('OCR_PDF_PAGE_JPEG_QUALITY', '85'))
+
+# Run preprocessing through OpenCL (cv2.UMat) when a device is available; set to false to force the CPU path
+OCR_USE_OPENCL = os.getenv('OCR_USE_OPENCL', 'true').lower() == 'true'
+
+# CLAHE objects are reusable but keep internal buffers, so each thread gets its own
+_thread_state = threading.local()
+
+# Bound concurrent downloads and their request rate to keep outbound traffic in check
+DOWNLOAD_SEM = asyncio.Semaphore(int(os.getenv('OCR_MAX_CONCURRENT_DOWNLOADS', '8')))
+DOWNLOAD_LIMITER = AsyncLimiter(float(os.getenv('OCR_DOWNLOADS_PER_SECOND', '20')), 1)
+
+
+async def _fetch_url(url: str) -> bytes:
+    """Fetch URL content through the shared client, within the download limits"""
+    async with DOWNLOAD_SEM, DOWNLOAD_LIMITER:
+        response = await get_http_client().get(url)
+    response.raise_for_status()
+    return response.content
 
-def download_image_from_url(url: str) -> np.ndarray:
-    """Download and convert image to OpenCV format"""
+
+async def download_image_from_url(url: str) -> bytes:
+    """Download raw image content from URL"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, timeout=30, headers=headers)
-        response.raise_for_status()
-        
-        # Convert to OpenCV format
-        image = Image.open(io.BytesIO(response.content))
-        opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        return opencv_image
+        return await _fetch_url(url)
         
     except Exception as e:
         logger.error(f"Error downloading image from {url}: {str(e)}")
         raise
 
 
-def download_pdf_from_url(url: str) -> bytes:
+def decode_image(image_content: bytes) -> np.ndarray:
+    """Convert downloaded image content to OpenCV format"""
+    # Decode straight to BGR; EXIF orientation is ignored, as it was when decoding through PIL
+    opencv_image = cv2.imdecode(np.frombuffer(image_content, dtype=np.uint8),
+                                cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if opencv_image is None:
+        # Formats OpenCV can't read (e.g. GIF) still go through PIL
+        image = Image.open(io.BytesIO(image_content)).convert('RGB')
+        opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    return opencv_image
+
+
+async def download_pdf_from_url(url: str) -> bytes:
     """Download PDF content from URL"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, timeout=30, headers=headers)
-        response.raise_for_status()
-        return response.content
+        return await _fetch_url(url)
         
     except Exception as e:
         logger.error(f"Error downloading PDF from {url}: {str(e)}")
         raise
 
 
-def preprocess_image_advanced(pil_image: Image.Image) -> Image.Image:
-    """Advanced image preprocessing using proven methods"""
+def _get_clahe() -> cv2.CLAHE:
+    """Return this thread's CLAHE instance, creating it on first use"""
+    clahe = getattr(_thread_state, 'clahe', None)
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        _thread_state.clahe = clahe
+    return clahe
+
+
+def downscale_for_ocr(image: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Shrink an image so its long edge is at most OCR_MAX_LONG_EDGE_PX; returns the image and the scale applied"""
+    height, width = image.shape[:2]
+    scale = min(1.0, OCR_MAX_LONG_EDGE_PX / max(width, height, 1))
+    if scale >= 1.0:
+        return image, 1.0
+    
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    logger.info(f"Downscaling {width}x{height} image to {size[0]}x{size[1]} for OCR")
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+@lru_cache(maxsize=None)
+def _opencl_enabled() -> bool:
+    """Whether to use the UMat path; probed once per process"""
+    enabled = OCR_USE_OPENCL and cv2.ocl.haveOpenCL()
+    cv2.ocl.setUseOpenCL(enabled)
+    if enabled:
+        logger.info(f"Using OpenCL for image preprocessing on {cv2.ocl.Device.getDefault().name()}")
+    return enabled
+
+
+def _preprocess_gray_umat(gray: np.ndarray) -> Image.Image:
+    """The _preprocess_gray pipeline on UMat, so intermediates stay on the OpenCL device"""
+    equalized = _get_clahe().apply(cv2.UMat(gray))
+    denoised = cv2.bilateralFilter(equalized, 9, 75, 75)
+    binary = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                 cv2.THRESH_BINARY, 11, 2)
+    cleaned = cv2.medianBlur(binary, 3)
+    # Only the final image is copied back to host memory
+    return Image.fromarray(cleaned.get())
+
+
+def _preprocess_gray(gray: np.ndarray) -> Image.Image:
+    """CLAHE, denoise, threshold and despeckle a grayscale page"""
+    if _opencl_enabled():
+        return _preprocess_gray_umat(gray)
+    
+    # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
+    equalized = _get_clahe().apply(gray)
+    
+    # Noise reduction using bilateral filter (cannot run in place)
+    denoised = cv2.bilateralFilter(equalized, 9, 75, 75)
+    
+    # Adaptive thresholding, reusing the equalized buffer
+    binary = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                 cv2.THRESH_BINARY, 11, 2, dst=equalized)
+    
+    # Despeckle the binary image, reusing the denoised buffer
+    cleaned = cv2.medianBlur(binary, 3, dst=denoised)
+    
+    # Convert back to PIL Image
+    return Image.fromarray(cleaned)
+
+
+def preprocess_image_advanced_np(bgr_image: np.ndarray) -> Image.Image:
+    """Advanced image preprocessing for a BGR array, without a PIL round trip"""
     try:
         logger.info("Applying advanced image preprocessing...")
         
-        # Convert to RGB if needed
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # Convert PIL Image to OpenCV format
-        cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-        
-        # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        gray = clahe.apply(gray)
-        
-        # Noise reduction using bilateral filter
-        gray = cv2.bilateralFilter(gray, 9, 75, 75)
-        
-        # Morphological operations to clean up the image
-        kernel = np.ones((1,1), np.uint8)
-        gray = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        gray = cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel)
-        
-        # Adaptive thresholding
-        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                     cv2.THRESH_BINARY, 11, 2)
-        
-        # Convert back to PIL Image
-        processed_image = Image.fromarray(binary)
-        
-        # Additional PIL enhancements
-        processed_image = processed_image.filter(ImageFilter.MedianFilter())
-        enhancer = ImageEnhance.Sharpness(processed_image)
-        processed_image = enhancer.enhance(2.0)
+        processed_image = _preprocess_gray(cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY))
         
         logger.info("Advanced preprocessing completed")
         return processed_image
         
     except Exception as e:
         logger.error(f"Error in advanced preprocessing: {e}")
-        return pil_image
+        return Image.fromarray(cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB))
 
 
-def image_to_base64(pil_image: Image.Image) -> str:
-    """Convert PIL Image to base64 string"""
+def image_to_base64_np(bgr_image: np.ndarray, image_format: str = 'PNG', quality: int = 85) -> str:
+    """Convert a BGR array to a base64 string (PNG, or JPEG at `quality`)"""
     try:
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format='PNG')
-        img_bytes = buffer.getvalue()
-        return base64.b64encode(img_bytes).decode('utf-8')
+        if image_format.upper() == 'JPEG':
+            ok, buffer = cv2.imencode('.jpg', bgr_image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        else:
+            ok, buffer = cv2.imencode('.png', bgr_image)
+        if not ok:
+            raise ValueError(f"{image_format} encoding failed")
+        return _b64.b64encode(buffer).decode('utf-8')
         
     except Exception as e:
         logger.error(f"Error converting image to base64: {str(e)}")
         return ""
 
 
-def process_pdf_pages(pdf_content: bytes) -> list:
-    """Process PDF pages and convert to PIL Images"""
+def _extract_text_layer(page: fitz.Page, mat: fitz.Matrix) -> Optional[Dict[str, Any]]:
+    """
+    Read a born-digital page's text layer, with word boxes in rendered-image pixels.
+    Returns None when the page has too little usable text and needs OCR.
+    """
+    text = page.get_text("text")
+    stripped = text.strip()
+    # Fonts without a Unicode mapping extract as replacement characters; OCR those pages instead
+    if len(stripped) < OCR_NATIVE_TEXT_MIN_CHARS or stripped.count('\ufffd') > len(stripped) * 0.05:
+        return None
+    
+    # Word boxes in the same column layout Tesseract's image_to_data produces
+    words = {column: [] for column in ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                                       'left', 'top', 'width', 'height', 'conf', 'text')}
+    # Text coordinates are on the unrotated page; map them onto the rendered pixmap
+    to_pixels = page.rotation_matrix * mat
+    for x0, y0, x1, y1, word, block_no, line_no, word_no in page.get_text("words"):
+        box = fitz.Rect(x0, y0, x1, y1) * to_pixels
+        for column, value in (
+            ('level', 5), ('page_num', 1), ('block_num', block_no + 1), ('par_num', 1),
+            ('line_num', line_no + 1), ('word_num', word_no + 1),
+            ('left', round(box.x0)), ('top', round(box.y0)),
+            ('width', round(box.width)), ('height', round(box.height)),
+            ('conf', 100.0), ('text', word)
+        ):
+            words[column].append(value)
+    return {'text': stripped, 'words': words}
+
+
+def _render_page(page: fitz.Page) -> Tuple[np.ndarray, float, Optional[Dict[str, Any]]]:
+    """Rasterize a PDF page to a BGR array and read its text layer"""
+    # Scale so the long edge lands near the OCR target, never above 2x
+    rect = page.rect
+    scale = min(MAX_PDF_RENDER_SCALE, OCR_TARGET_LONG_EDGE_PX / max(rect.width, rect.height))
+    mat = fitz.Matrix(scale, scale)
+    # No alpha channel: pages are opaque and RGB samples are a quarter smaller than RGBA
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    # cvtColor copies out of the pixmap's buffer, which is freed with it
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), scale, _extract_text_layer(page, mat)
+
+
+def _render_pdf_pages(pdf_path: str, start: int, stop: int) -> List[Tuple[int, np.ndarray, float, Optional[Dict[str, Any]]]]:
+    """Rasterize pages [start, stop) of a PDF (runs in a worker process, which opens the document for this run only)"""
+    with fitz.open(pdf_path) as doc:
+        return [(page_index, *_render_page(doc.load_page(page_index))) for page_index in range(start, stop)]
+
+
+def _pdf_page_entry(page_index: int, image: np.ndarray, scale: float, text_layer: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Wrap a rendered page as a page entry"""
+    return {
+        'page_number': page_index + 1,
+        'image': image,
+        'scale': scale,
+        'text_layer': text_layer
+    }
+
+
+def iter_pdf_pages(pdf_content: bytes, executor: Optional[Executor] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Rasterize PDF pages lazily and yield them as BGR arrays, in page order
+    
+    Pages are rendered on `executor` when given (e.g. the shared OCR pool),
+    otherwise on a process pool created for this document.
+    """
+    with fitz.open(stream=pdf_content, filetype='pdf') as doc:
+        page_count = len(doc)
+        if page_count == 1:
+            # Nothing to parallelize; render straight from the in-memory document
+            yield _pdf_page_entry(0, *_render_page(doc.load_page(0)))
+    if page_count <= 1:
+        return
+    
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
+        tmp_file.write(pdf_content)
+        tmp_file_path = tmp_file.name
+    
     try:
-        pages_data = []
-        
-        # Process PDF pages
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
-            tmp_file.write(pdf_content)
-            tmp_file_path = tmp_file.name
-        
-        try:
-            doc = fitz.open(tmp_file_path)
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                
-                # Convert page to high-resolution image
-                mat = fitz.Matrix(2.0, 2.0)  # 2x resolution
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("png")
-                
-                # Convert to PIL Image
-                pil_image = Image.open(io.BytesIO(img_data))
-                
-                pages_data.append({
-                    'page_number': page_num + 1,
-                    'pil_image': pil_image
-                })
-            
-            return pages_data
-            
-        finally:
-            try:
-                doc.close()
-            except:
-                pass
+        # Rasterize runs of pages in parallel; PyMuPDF documents can't be shared across
+        # processes so each task opens the file once for its run and closes it after.
+        # Only a small window of pages is rendered ahead of the consumer, so memory
+        # stays flat however long the document is.
+        max_workers = min(os.cpu_count() or 1, page_count)
+        # Short documents still spread one page per worker
+        chunk_pages = max(1, min(PDF_RENDER_CHUNK_PAGES, page_count // max_workers))
+        max_pending = max(1, 2 * max_workers // chunk_pages)
+        with ExitStack() as stack:
+            if executor is None:
+                executor = stack.enter_context(ProcessPoolExecutor(max_workers=max_workers))
+            pending = deque()
+            next_page = 0
             try:
-                os.unlink(tmp_file_path)
-            except:
-                pass
-                
-    except Exception as e:
-        logger.error(f"Error processing PDF pages: {str(e)}")
-        raise
\ No newline at end of file
+                while pending or next_page < page_count:
+                    while next_page < page_count and len(pending) < max_pending:
+                        stop = min(next_page + chunk_pages, page_count)
+                        pending.append(executor.submit(_render_pdf_pages, tmp_file_path, next_page, stop))
+                        next_page = stop
+                    for page in pending.popleft().result():
+                        yield _pdf_page_entry(*page)
+            finally:
+                # A shared executor outlives this document; drop renders nobody will read
+                for future in pending:
+                    future.cancel()
+    finally:
+        try:
+            os.unlink(tmp_file_path)
+        except:
+            pass
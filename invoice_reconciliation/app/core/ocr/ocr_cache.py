@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import cv2
+import diskcache
+import numpy as np
+
+from app.schemas.ocr_result import DocumentResult
+from .image_processor import (
+    MAX_PDF_RENDER_SCALE,
+    OCR_MAX_LONG_EDGE_PX,
+    OCR_NATIVE_TEXT_MIN_CHARS,
+    OCR_TARGET_LONG_EDGE_PX,
+    PDF_PAGE_JPEG_QUALITY
+)
+from .ocr_helpers import TESSDATA_DIR, TESSERACT_LANG
+from .text_extractor import OCR_CONF_SHORTCIRCUIT
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ginthi_ocr_cache'))
+OCR_CACHE_TTL_SECONDS = int(os.getenv('OCR_CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+OCR_CACHE_SIZE_LIMIT = int(os.getenv('OCR_CACHE_SIZE_LIMIT', str(2 * 1024 ** 3)))
+
+# Per-page results kept in memory, for duplicate pages across different documents
+OCR_PAGE_CACHE_SIZE = int(os.getenv('OCR_PAGE_CACHE_SIZE', '512'))
+# Photos and other noisy images rarely repeat pixel for pixel, so they are not worth a slot
+OCR_PAGE_CACHE_MAX_ENTROPY = float(os.getenv('OCR_PAGE_CACHE_MAX_ENTROPY', '7.0'))
+
+# On-disk LRU shared by all worker processes on the host
+_cache = diskcache.Cache(OCR_CACHE_DIR, size_limit=OCR_CACHE_SIZE_LIMIT, eviction_policy='least-recently-used')
+
+# In-memory LRU of pickled page results; pickling gives every hit its own copy to mutate
+_OCR_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+
+
+# Bump when the cached result type changes so stale entries are never served
+CACHE_KEY_VERSION = 2
+
+# Settings that change OCR output; results produced under different values get different keys
+OCR_SETTINGS_DIGEST = hashlib.sha256(repr((
+    TESSERACT_LANG,
+    TESSDATA_DIR,
+    OCR_MAX_LONG_EDGE_PX,
+    OCR_TARGET_LONG_EDGE_PX,
+    MAX_PDF_RENDER_SCALE,
+    PDF_PAGE_JPEG_QUALITY,
+    OCR_NATIVE_TEXT_MIN_CHARS,
+    OCR_CONF_SHORTCIRCUIT
+)).encode()).hexdigest()[:16]
+
+
+def content_key(file_type: str, content: bytes) -> str:
+    """Build a content-addressed cache key from the downloaded document bytes and the OCR settings"""
+    return f"ocr:v{CACHE_KEY_VERSION}:{OCR_SETTINGS_DIGEST}:{file_type}:{hashlib.sha256(content).hexdigest()}"
+
+
+async def get_cached_result(key: str, url: str) -> Optional[DocumentResult]:
+    """Return a cached OCR result for the key, or None on a miss"""
+    try:
+        result = await asyncio.to_thread(_cache.get, key)
+    except Exception as e:
+        logger.warning(f"OCR cache lookup failed: {e}")
+        return None
+    
+    if result is None:
+        return None
+    
+    logger.info(f"OCR cache hit for {url}")
+    # The same document may be served from a different URL
+    result.source_url = url
+    return result
+
+
+def extraction_failed(result: Dict[str, Any]) -> bool:
+    """Whether a page extraction recorded an error, including OCR timeouts and failed fallbacks"""
+    return "error" in result.get("metadata", {})
+
+
+async def cache_result(key: str, result: DocumentResult, extractions: List[Dict[str, Any]]) -> None:
+    """
+    Store an OCR result under the key, given the page extractions it was built from.
+    Results with a failed page, or no recognized text at all, are not stored so a retry OCRs again.
+    """
+    if any(extraction_failed(extraction) for extraction in extractions) or not any(
+        extraction.get("plain_text", "").strip() for extraction in extractions
+    ):
+        logger.info(f"Not caching degraded OCR result for {result.source_url}")
+        return
+    try:
+        await asyncio.to_thread(_cache.set, key, result, expire=OCR_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"OCR cache store failed: {e}")
+
+
+def _gray_entropy(gray: np.ndarray) -> float:
+    """Shannon entropy (bits) of an 8-bit grayscale histogram"""
+    hist = np.bincount(gray.ravel(), minlength=256)
+    p = hist[hist > 0] / gray.size
+    return float(-(p * np.log2(p)).sum())
+
+
+def page_cache_key(image: np.ndarray) -> Optional[str]:
+    """Hash a page's pixels for the page cache, or None if the page is not worth caching"""
+    if OCR_PAGE_CACHE_SIZE <= 0:
+        return None
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if _gray_entropy(gray) > OCR_PAGE_CACHE_MAX_ENTROPY:
+        return None
+    digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16)
+    digest.update(f"bgr:{image.shape}".encode())
+    return digest.hexdigest()
+
+
+def get_page_result(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Return a copy of the cached extraction result for a page key, or None on a miss"""
+    if key is None or key not in _OCR_CACHE:
+        return None
+    _OCR_CACHE.move_to_end(key)
+    logger.info("OCR page cache hit")
+    return pickle.loads(_OCR_CACHE[key])
+
+
+def cache_page_result(key: Optional[str], result: Dict[str, Any]) -> None:
+    """Store a successful page extraction result, evicting the least recently used entry when full"""
+    # Failed or empty pages are worth another OCR attempt next time they are seen
+    if key is None or extraction_failed(result) or not result.get("plain_text", "").strip():
+        return
+    _OCR_CACHE[key] = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    _OCR_CACHE.move_to_end(key)
+    while len(_OCR_CACHE) > OCR_PAGE_CACHE_SIZE:
+        _OCR_CACHE.popitem(last=False)
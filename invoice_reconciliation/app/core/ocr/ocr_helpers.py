@@ -1,44 +1,177 @@
-import threading
-import time
 import logging
-from typing import Dict, List, Any, Tuple, Optional
+import shlex
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Tuple, Optional, Iterator, Union
 import pytesseract
 import os
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 logger = logging.getLogger(__name__)
 
-def run_with_timeout(func, args=(), kwargs=None, timeout_seconds=180):
-    """Run function with timeout using threading (Windows compatible)"""
-    if kwargs is None:
-        kwargs = {}
+TSV_INT_COLUMNS = (
+    'level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+    'left', 'top', 'width', 'height'
+)
+TSV_HEADER = '\t'.join(TSV_INT_COLUMNS + ('conf', 'text'))
+
+# Recognition language(s) and an optional tessdata directory, used by both backends
+TESSERACT_LANG = os.getenv('TESSERACT_LANG', 'eng')
+TESSDATA_DIR = os.getenv('TESSDATA_DIR')
+
+# Per-thread tesserocr APIs keyed by OCR engine mode, so the model is loaded once per thread
+_thread_state = threading.local()
+
+
+class OCRTimeoutError(Exception):
+    """Raised when a Tesseract run exceeds its time budget"""
+
+
+def parse_ocr_config(config: str) -> Tuple[int, int]:
+    """Extract the (oem, psm) pair from a Tesseract CLI config string"""
+    args = shlex.split(config)
+    oem, psm = 3, 3
+    for flag, value in zip(args, args[1:]):
+        if flag == '--oem':
+            oem = int(value)
+        elif flag == '--psm':
+            psm = int(value)
+    return oem, psm
+
+
+def _get_tesserocr_api(oem: int):
+    """Return this thread's tesserocr API for the given engine mode, creating it on first use"""
+    apis = getattr(_thread_state, 'apis', None)
+    if apis is None:
+        apis = _thread_state.apis = {}
+    api = apis.get(oem)
+    if api is None:
+        kwargs = {'path': TESSDATA_DIR} if TESSDATA_DIR else {}
+        api = tesserocr.PyTessBaseAPI(lang=TESSERACT_LANG, oem=oem, **kwargs)
+        apis[oem] = api
+    return api
+
+
+def warm_tesseract_api(config: str = '') -> None:
+    """Load this thread's in-process Tesseract model for the config's engine mode (no-op for the CLI backend)"""
+    if tesserocr is not None:
+        _get_tesserocr_api(parse_ocr_config(config)[0])
+
+
+def _recognize_in_process(image: Image.Image, config: str, timeout_seconds: int):
+    """Run recognition with the in-process tesserocr API and return the API for reading results"""
+    oem, psm = parse_ocr_config(config)
+    api = _get_tesserocr_api(oem)
+    api.SetPageSegMode(psm)
+    api.SetImage(image)
+    if not api.Recognize(timeout_seconds * 1000):
+        raise OCRTimeoutError(f"Tesseract timed out after {timeout_seconds} seconds")
+    return api
+
+
+def run_tesseract(image_path: str, config: str = '', timeout_seconds: int = 60, tsv: bool = False) -> str:
+    """
+    Run the tesseract binary on an image file and return its stdout.
+    Raises OCRTimeoutError after the child is killed on timeout.
+    """
+    tesseract_cmd = os.getenv('TESSERACT_CMD') or pytesseract.pytesseract.tesseract_cmd
+    cmd = [tesseract_cmd, image_path, 'stdout', '-l', TESSERACT_LANG]
+    if TESSDATA_DIR:
+        cmd += ['--tessdata-dir', TESSDATA_DIR]
+    cmd += shlex.split(config)
+    if tsv:
+        cmd += ['-c', 'tessedit_create_tsv=1']
     
-    result = [None]
-    exception = [None]
+    try:
+        completed = subprocess.run(cmd, capture_output=True, timeout=timeout_seconds)
+    except subprocess.TimeoutExpired:
+        raise OCRTimeoutError(f"Tesseract timed out after {timeout_seconds} seconds")
+    if completed.returncode != 0:
+        stderr = completed.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"Tesseract exited with status {completed.returncode}: {stderr}")
+    return completed.stdout.decode('utf-8', errors='replace')
+
+
+def parse_tesseract_tsv(tsv_output: str) -> Dict[str, List]:
+    """Parse Tesseract TSV output into the same column dict pytesseract's Output.DICT returns"""
+    rows = tsv_output.splitlines()
+    if not rows:
+        return {column: [] for column in TSV_INT_COLUMNS + ('conf', 'text')}
     
-    def target():
+    header = rows[0].split('\t')
+    data = {column: [] for column in header}
+    for row in rows[1:]:
+        values = row.split('\t')
+        if len(values) < len(header) - 1:
+            continue
+        # The trailing text column is dropped for non-word rows
+        values += [''] * (len(header) - len(values))
+        for column, value in zip(header, values):
+            if column in TSV_INT_COLUMNS:
+                data[column].append(int(value))
+            elif column == 'conf':
+                data[column].append(float(value))
+            else:
+                data[column].append(value)
+    return data
+
+
+def image_to_data(source: Union[Image.Image, str], config: str = '', timeout_seconds: int = 60) -> Dict[str, List]:
+    """Run Tesseract and return word-level data as a column dict"""
+    if tesserocr is not None:
+        api = _recognize_in_process(source, config, timeout_seconds)
+        # GetTSVText omits the header row that the CLI renderer writes
+        return parse_tesseract_tsv(f"{TSV_HEADER}\n{api.GetTSVText(0)}")
+    return parse_tesseract_tsv(run_tesseract(source, config, timeout_seconds, tsv=True))
+
+
+def image_to_string(source: Union[Image.Image, str], config: str = '', timeout_seconds: int = 60) -> str:
+    """Run Tesseract and return the recognized plain text"""
+    if tesserocr is not None:
+        return _recognize_in_process(source, config, timeout_seconds).GetUTF8Text()
+    return run_tesseract(source, config, timeout_seconds)
+
+
+@contextmanager
+def image_temp_file(image: Image.Image) -> Iterator[str]:
+    """Save an image to a temporary PNG so repeated Tesseract calls can share one encoded file"""
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
+        tmp_file_path = tmp_file.name
+    try:
+        # Fast compression: the file is ephemeral and Tesseract decodes it straight away
+        image.save(tmp_file_path, 'PNG', compress_level=1)
+        yield tmp_file_path
+    finally:
         try:
-            result[0] = func(*args, **kwargs)
-        except Exception as e:
-            exception[0] = e
-    
-    thread = threading.Thread(target=target)
-    thread.daemon = True
-    thread.start()
-    thread.join(timeout_seconds)
-    
-    if thread.is_alive():
-        logger.warning(f"Function timed out after {timeout_seconds} seconds")
-        return None, True  # result, timed_out
-    
-    if exception[0]:
-        raise exception[0]
-    
-    return result[0], False  # result, timed_out
+            os.unlink(tmp_file_path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def tesseract_source(image: Image.Image) -> Iterator[Union[Image.Image, str]]:
+    """Yield the input the OCR backend consumes: the image itself in-process, or a shared temp PNG for the CLI"""
+    if tesserocr is not None:
+        yield image
+        return
+    with image_temp_file(image) as image_path:
+        yield image_path
 
 
 def test_tesseract() -> None:
     """Test if Tesseract is properly configured"""
     try:
+        if tesserocr is not None:
+            logger.info(f"Using in-process tesserocr, Tesseract OCR version: {tesserocr.tesseract_version()}")
+            return
+        
         # Set Tesseract path from environment variable
         tesseract_cmd = os.getenv('TESSERACT_CMD')
         if tesseract_cmd:
@@ -0,0 +1,98 @@
+import asyncio
+import multiprocessing
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional
+
+import cv2
+import numpy as np
+
+from .image_processor import downscale_for_ocr, preprocess_image_advanced_np
+from .text_extractor import extract_all_data_advanced, warm_up_ocr
+
+logger = logging.getLogger(__name__)
+
+OCR_POOL_WORKERS = int(os.getenv('OCR_POOL_WORKERS', str(os.cpu_count() or 1)))
+# Seconds start_ocr_pool waits for all workers to start and warm up
+OCR_POOL_START_TIMEOUT = float(os.getenv('OCR_POOL_START_TIMEOUT', '120'))
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Shared with the workers at spawn time; start_ocr_pool holds one task per worker on it
+_start_barrier = None
+
+
+def _init_ocr_worker(start_barrier) -> None:
+    """Pool worker initializer: keep OpenCV single-threaded and load the Tesseract model up front"""
+    global _start_barrier
+    _start_barrier = start_barrier
+    # The pool already spans the cores
+    cv2.setNumThreads(1)
+    try:
+        warm_up_ocr()
+    except Exception as e:
+        # First requests just pay the model load instead
+        logger.warning(f"OCR worker warm-up failed: {e}")
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    """Return the shared OCR process pool, creating it on first use"""
+    global _pool, _start_barrier
+    if _pool is None:
+        # One Tesseract thread per worker, as the pool already spans the cores. libtesseract's
+        # OpenMP runtime reads this when the library loads, before the initializer runs,
+        # so it is set here for the spawned workers to inherit.
+        os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+        # Spawned workers start clean instead of inheriting the server's threads, event loop and clients
+        context = multiprocessing.get_context('spawn')
+        # Synchronization primitives can only reach workers as initializer arguments
+        _start_barrier = context.Barrier(OCR_POOL_WORKERS)
+        _pool = ProcessPoolExecutor(
+            max_workers=OCR_POOL_WORKERS,
+            mp_context=context,
+            initializer=_init_ocr_worker,
+            initargs=(_start_barrier,)
+        )
+        logger.info(f"OCR process pool started with {OCR_POOL_WORKERS} workers")
+    return _pool
+
+
+def _wait_for_pool_start() -> int:
+    """Block until every pool worker has started and run its initializer"""
+    _start_barrier.wait(timeout=OCR_POOL_START_TIMEOUT)
+    return os.getpid()
+
+
+async def start_ocr_pool() -> None:
+    """Start and warm every OCR pool worker at application startup so no request pays for worker start-up"""
+    pool = get_ocr_pool()
+    loop = asyncio.get_running_loop()
+    # Workers spawn one per submission. Each task waits at the barrier until all of them arrive,
+    # so no worker can take a second one: every worker gets started and warmed before this returns.
+    try:
+        pids = await asyncio.gather(*(
+            loop.run_in_executor(pool, _wait_for_pool_start) for _ in range(OCR_POOL_WORKERS)
+        ))
+    except threading.BrokenBarrierError:
+        # Slow machine: the remaining workers finish starting under the first requests
+        logger.warning(f"OCR pool workers did not all start within {OCR_POOL_START_TIMEOUT} seconds")
+        return
+    logger.info(f"OCR pool warmed up: {len(set(pids))} workers ready")
+
+
+def shutdown_ocr_pool() -> None:
+    """Stop the OCR pool workers at application shutdown"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        logger.info("OCR process pool shut down")
+
+
+def ocr_image(image: np.ndarray) -> Dict[str, Any]:
+    """Preprocess and OCR a single BGR array (runs inside a pool worker)"""
+    # Work at OCR resolution; word boxes are mapped back to the original image
+    image, scale = downscale_for_ocr(image)
+    processed_image = preprocess_image_advanced_np(image)
+    return extract_all_data_advanced(image, processed_image, ocr_scale=scale)
@@ -1,183 +1,264 @@
-import pytesseract
-import time
 import logging
+import os
+import time
+import numpy as np
 from PIL import Image
-from typing import Dict, List, Any
-from .ocr_helpers import run_with_timeout, get_ocr_configs, calculate_average_confidence
+from typing import Dict, List, Any, Optional, Tuple, Union
+from .ocr_helpers import (
+    get_ocr_configs,
+    calculate_average_confidence,
+    tesseract_source,
+    image_to_data,
+    image_to_string,
+    warm_tesseract_api,
+    OCRTimeoutError
+)
 
 logger = logging.getLogger(__name__)
 
+# Configurations tested for plain text extraction, in order of preference
+PLAIN_TEXT_CONFIGS = [
+    'default',
+    'uniform_text',
+    'single_block',
+    'sparse_text',
+    'sparse_text_osd'
+]
+
+# Stop testing configs once one reaches this average confidence
+OCR_CONF_SHORTCIRCUIT = float(os.getenv('OCR_CONF_SHORTCIRCUIT', '90'))
+
+# Placeholder texts returned when even the basic OCR fallback gives nothing; reported as errors
+OCR_TIMEOUT_TEXT = "OCR processing timed out - unable to extract text"
+OCR_FAILED_TEXT = "OCR processing failed"
+
+# Structure-of-arrays layout for recognized words
+WORD_INT_COLUMNS = ('left', 'top', 'width', 'height', 'level', 'block_num', 'par_num', 'line_num', 'word_num')
+WORD_DTYPE = np.dtype([(name, np.int32) for name in WORD_INT_COLUMNS] + [('conf', np.float64), ('text', object)])
+
+
+def _run_ocr_config(source: Union[Image.Image, str], config_name: str, config: str) -> Optional[Tuple[float, str, Dict[str, List]]]:
+    """Run a single OCR configuration and return its average confidence, text and word-level data"""
+    logger.info(f"  Testing config: {config_name}")
+
+    try:
+        data = image_to_data(source, config=config, timeout_seconds=60)
+    except OCRTimeoutError:
+        logger.warning(f"Config {config_name} timed out after 60 seconds")
+        return None
+    # Calculate average confidence
+    confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+    if not confidences:
+        return None
+    avg_confidence = sum(confidences) / len(confidences)
+    logger.info(f"    {config_name} average confidence: {avg_confidence:.2f}%")
+    return avg_confidence, '\n'.join([t for t in data['text'] if t.strip()]), data
+
+
+def warm_up_ocr() -> None:
+    """Load this thread's Tesseract model ahead of the first page"""
+    warm_tesseract_api(get_ocr_configs()['default'])
+
+
+def build_word_array(data: Dict[str, List], min_conf: float = 30) -> np.ndarray:
+    """Pack confident, non-empty Tesseract words into a structured array (one column per field)"""
+    texts = np.array([t.strip() for t in data['text']], dtype=object)
+    conf = np.asarray(data['conf'], dtype=np.float64)
+    keep = (conf > min_conf) & texts.astype(bool)
+    
+    words = np.empty(int(keep.sum()), dtype=WORD_DTYPE)
+    words['text'] = texts[keep]
+    words['conf'] = conf[keep]
+    for column in WORD_INT_COLUMNS:
+        words[column] = np.asarray(data[column], dtype=np.int32)[keep]
+    return words
+
 
-def extract_plain_text_advanced(processed_image: Image.Image) -> str:
-    """Extract plain text using multiple OCR configurations and best result selection"""
+def word_records(words: np.ndarray) -> List[Dict[str, Any]]:
+    """Expand a word array into the positioned text element dicts returned by the API"""
+    columns = {name: words[name].tolist() for name in WORD_DTYPE.names}
+    return [
+        {
+            'text': text,
+            'text_lc': text.casefold(),  # normalized once for downstream matching
+            'confidence': confidence,
+            'bbox': {
+                'left': left,
+                'top': top,
+                'width': width,
+                'height': height
+            },
+            'level': level,
+            'block_num': block_num,
+            'par_num': par_num,
+            'line_num': line_num,
+            'word_num': word_num
+        }
+        for text, confidence, left, top, width, height, level, block_num, par_num, line_num, word_num in zip(
+            columns['text'], columns['conf'], columns['left'], columns['top'], columns['width'],
+            columns['height'], columns['level'], columns['block_num'], columns['par_num'],
+            columns['line_num'], columns['word_num']
+        )
+    ]
+
+
+def extract_plain_text_advanced(processed_image: Image.Image) -> Tuple[str, Optional[Dict[str, List]], Optional[str]]:
+    """
+    Extract plain text using multiple OCR configurations and best result selection
+    
+    Returns:
+        Tuple of (best text, word-level data of the best config, best config name).
+        The data and config name are None when no config produced a usable result.
+    """
     try:
         logger.info("Extracting plain text with advanced OCR methods...")
         
         ocr_configs = get_ocr_configs()
         
         # Test multiple configurations
-        configs_to_test = [
-            'default',
-            'uniform_text',
-            'single_block',
-            'sparse_text',
-            'sparse_text_osd'
-        ]
+        configs_to_test = PLAIN_TEXT_CONFIGS
         
         best_text = ""
-        max_confidence = 0
+        best_data = None
+        best_config_name = None
         timeout_seconds = 180
-        start_time = time.time()
+        deadline = time.monotonic() + timeout_seconds
+        results = {}
         
-        for config_name in configs_to_test:
-            if time.time() - start_time > timeout_seconds:
-                logger.warning(f"Total processing time exceeded {timeout_seconds} seconds. Stopping OCR tests.")
-                break
-            try:
-                config = ocr_configs[config_name]
-                logger.info(f"  Testing config: {config_name}")
-
-                def ocr_task():
-                    return pytesseract.image_to_data(processed_image, config=config, output_type=pytesseract.Output.DICT)
-            
-                data, timed_out = run_with_timeout(ocr_task, timeout_seconds=60)
-                
-                if timed_out:
-                    logger.warning(f"Config {config_name} timed out after 60 seconds")
+        # Encode the preprocessed image at most once and share it across all configs
+        with tesseract_source(processed_image) as source:
+            # Configs run one after another: the OCR pool already keeps every core busy with one Tesseract each
+            for rank, config_name in enumerate(configs_to_test):
+                if time.monotonic() > deadline:
+                    logger.warning(f"Total processing time exceeded {timeout_seconds} seconds. Stopping OCR tests.")
+                    break
+                try:
+                    result = _run_ocr_config(source, config_name, ocr_configs[config_name])
+                except Exception as e:
+                    logger.warning(f"Config {config_name} failed: {e}")
                     continue
-                # Calculate average confidence
-                confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-                if confidences:
-                    avg_confidence = sum(confidences) / len(confidences)
-                    logger.info(f"    Average confidence: {avg_confidence:.2f}%")
-                    
-                    if avg_confidence > max_confidence:
-                        max_confidence = avg_confidence
-                        best_text = '\n'.join([t for t in data['text'] if t.strip()])
-                        if best_text:
-                            logger.info(f"    New best result (confidence: {avg_confidence:.2f}%)")
-                            
-            except Exception as e:
-                logger.warning(f"Config {config_name} failed: {e}")
-                continue
+                if result is None:
+                    continue
+                results[rank] = result
+                # Clean invoices usually converge on the first config
+                if result[0] > OCR_CONF_SHORTCIRCUIT:
+                    logger.info(f"{config_name} confidence above {OCR_CONF_SHORTCIRCUIT}%, skipping remaining configs")
+                    break
+            
+            if results:
+                # Highest confidence wins; ties go to the config listed first
+                best_rank = max(results, key=lambda rank: (results[rank][0], -rank))
+                max_confidence, best_text, best_data = results[best_rank]
+                best_config_name = configs_to_test[best_rank]
+                logger.info(f"    Best result from {best_config_name} (confidence: {max_confidence:.2f}%)")
         
-        # Fallback to basic OCR if no good result
-        if not best_text.strip():
-            logger.info("Falling back to basic OCR...")
-            try:
-                def basic_ocr_task():
-                    return pytesseract.image_to_string(processed_image)
-                
-                basic_result, timed_out = run_with_timeout(basic_ocr_task, timeout_seconds=30)
-                
-                if not timed_out and basic_result:
-                    best_text = basic_result
-                elif timed_out:
-                    logger.warning("Basic OCR also timed out")
-                    best_text = "OCR processing timed out - unable to extract text"
+            # Fallback to basic OCR if no good result
+            if not best_text.strip():
+                logger.info("Falling back to basic OCR...")
+                try:
+                    basic_result = image_to_string(source, timeout_seconds=30)
+                    if basic_result:
+                        best_text = basic_result
                     
-            except Exception as e:
-                logger.error(f"Basic OCR failed: {e}")
-                best_text = "OCR processing failed"
+                except OCRTimeoutError:
+                    logger.warning("Basic OCR also timed out")
+                    best_text = OCR_TIMEOUT_TEXT
+                except Exception as e:
+                    logger.error(f"Basic OCR failed: {e}")
+                    best_text = OCR_FAILED_TEXT
         
         logger.info(f"Plain text extraction completed. Extracted {len(best_text)} characters")
-        return best_text.strip()
+        return best_text.strip(), best_data, best_config_name
         
     except Exception as e:
         logger.error(f"Error in advanced plain text extraction: {e}")
-        return ""
+        return "", None, None
 
 
-def extract_text_with_confidence_and_positioning_advanced(processed_image: Image.Image) -> List[Dict[str, Any]]:
-    """Extract text with confidence and positioning using advanced preprocessing with timeout"""
-    try:
-        logger.info("Extracting structured text with advanced methods...")
-        
-        ocr_configs = get_ocr_configs()
-        
-        def structured_ocr_task():
-            data = pytesseract.image_to_data(
-                processed_image, 
-                output_type=pytesseract.Output.DICT,
-                config=ocr_configs['default']
-            )
-            
-            results = []
-            n_boxes = len(data['text'])
-            
-            for i in range(n_boxes):
-                text = data['text'][i].strip()
-                confidence = float(data['conf'][i])
-                
-                if text and confidence > 30:
-                    result = {
-                        'text': text,
-                        'confidence': confidence,
-                        'bbox': {
-                            'left': int(data['left'][i]),
-                            'top': int(data['top'][i]),
-                            'width': int(data['width'][i]),
-                            'height': int(data['height'][i])
-                        },
-                        'level': int(data['level'][i]),
-                        'block_num': int(data['block_num'][i]),
-                        'par_num': int(data['par_num'][i]),
-                        'line_num': int(data['line_num'][i]),
-                        'word_num': int(data['word_num'][i])
-                    }
-                    results.append(result)
-            
-            return results
-        
-        results, timed_out = run_with_timeout(structured_ocr_task, timeout_seconds=60)
-        
-        if timed_out:
-            logger.warning("Structured text extraction timed out. Returning empty results.")
-            results = []
-        elif results is None:
-            results = []
-        
-        logger.info(f"Extracted {len(results)} text elements with positioning")
-        return results
+def _assemble_extraction(plain_text: str, words: np.ndarray, processing_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the extraction result (structured data, key/value pairs, tables, metadata) from recognized words"""
+    from .data_parser import extract_key_value_pairs_advanced, extract_table_data_advanced, group_word_indices_into_lines
+    
+    structured_data = word_records(words)
+    # Line grouping works on the coordinate columns directly
+    lines = [
+        [structured_data[i] for i in group]
+        for group in group_word_indices_into_lines(words['top'], words['left'])
+    ]
+    key_value_pairs = extract_key_value_pairs_advanced(lines)  
+    tables = extract_table_data_advanced(lines)  
+    avg_confidence = calculate_average_confidence(structured_data)
+
+    return {
+        "plain_text": plain_text,
+        "structured_data": structured_data,
+        "key_value_pairs": key_value_pairs,
+        "tables": tables,
+        "metadata": {
+            "total_text_elements": len(structured_data),
+            "average_confidence": avg_confidence,
+            "tables_found": len(tables),
+            **processing_info
+        }
+    }
+
+
+def extract_all_data_from_text_layer(plain_text: str, words_data: Dict[str, List]) -> Dict[str, Any]:
+    """
+    Extract all types of data from a PDF page's text layer, without OCR
+    
+    Args:
+        plain_text: The page's extracted text
+        words_data: Word boxes in Tesseract's image_to_data column layout
         
+    Returns:
+        Dictionary with all extracted data, shaped like extract_all_data_advanced's
+    """
+    try:
+        return _assemble_extraction(plain_text, build_word_array(words_data), {
+            "ocr_config": None,
+            "skipped_ocr": True,
+            "processing_method": "pdf_text_layer"
+        })
     except Exception as e:
-        logger.error(f"Error in advanced structured text extraction: {e}")
-        return []
+        logger.error(f"Error in text layer extraction: {str(e)}")
+        return {
+            "plain_text": plain_text,
+            "structured_data": [],
+            "key_value_pairs": {},
+            "tables": [],
+            "metadata": {"error": str(e)}
+        }
 
 
-def extract_all_data_advanced(pil_image: Image.Image, processed_image: Image.Image) -> Dict[str, Any]:
+def extract_all_data_advanced(image: np.ndarray, processed_image: Image.Image, ocr_scale: float = 1.0) -> Dict[str, Any]:
     """
     Extract all types of data using advanced preprocessing and methods
     
     Args:
-        pil_image: Original PIL Image object
+        image: Original BGR array
         processed_image: Preprocessed PIL Image object
+        ocr_scale: Factor the original was downscaled by before OCR; word boxes are mapped back by 1/ocr_scale
         
     Returns:
         Dictionary with all extracted data
     """
     try:
-        from .data_parser import extract_key_value_pairs_advanced, extract_table_data_advanced, group_words_into_lines
-        
-        plain_text = extract_plain_text_advanced(processed_image)
-        structured_data = extract_text_with_confidence_and_positioning_advanced(processed_image)
-        lines = group_words_into_lines(structured_data)  
-        key_value_pairs = extract_key_value_pairs_advanced(lines)  
-        tables = extract_table_data_advanced(lines)  
-        avg_confidence = calculate_average_confidence(structured_data)
-
-        return {
-            "plain_text": plain_text,
-            "structured_data": structured_data,
-            "key_value_pairs": key_value_pairs,
-            "tables": tables,
-            "metadata": {
-                "total_text_elements": len(structured_data),
-                "average_confidence": avg_confidence,
-                "tables_found": len(tables),
-                "processing_method": "advanced_ocr_with_preprocessing"
-            }
+        # The best config's word data doubles as the structured result, saving a separate Tesseract run
+        plain_text, best_data, best_config_name = extract_plain_text_advanced(processed_image)
+        words = build_word_array(best_data) if best_data else np.empty(0, dtype=WORD_DTYPE)
+        if ocr_scale != 1.0:
+            # Report positions in original image coordinates, before line grouping so its pixel thresholds keep their meaning
+            for column in ('left', 'top', 'width', 'height'):
+                words[column] = np.rint(words[column] / ocr_scale)
+        processing_info = {
+            "ocr_config": best_config_name,
+            "ocr_scale": ocr_scale,
+            "processing_method": "advanced_ocr_with_preprocessing"
         }
+        if plain_text in (OCR_TIMEOUT_TEXT, OCR_FAILED_TEXT):
+            processing_info["error"] = plain_text
+        return _assemble_extraction(plain_text, words, processing_info)
     except Exception as e:
         logger.error(f"Error in advanced data extraction: {str(e)}")
         return {
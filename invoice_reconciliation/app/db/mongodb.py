@@ -3,9 +3,7 @@ import os
 import motor.motor_asyncio
 from beanie import init_beanie
 from dotenv import load_dotenv
-import inspect
-import app.schemas as schemas
-from beanie import Document
+from app.schemas import DOCUMENT_MODELS as document_models
 
 load_dotenv()
 
@@ -15,12 +13,6 @@ MONGO_DB = os.getenv("MONGO_DB")
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
 db = client[MONGO_DB]
 
-# Collect all Beanie Document subclasses
-document_models = [
-    cls for name, cls in inspect.getmembers(schemas)
-    if inspect.isclass(cls) and issubclass(cls, Document)
-]
-
 print(
     f"Document models found: {[model.__name__ for model in document_models]}")
 
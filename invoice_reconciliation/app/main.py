@@ -5,6 +5,9 @@ import logging
 from app.db.mongodb import init_db
 from app.api import llm_apis, health, ocr_api
 from app.utils.active_llm import ACTIVE_LLM
+from app.utils.http import get_http_client, close_http_client
+from app.core.ocr.ocr_pool import start_ocr_pool, shutdown_ocr_pool
+from app.utils.responses import MsgspecJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.gzip import GZipMiddleware
 
@@ -27,13 +30,21 @@ async def lifespan(app: FastAPI):
     else:
         print(" No active LLM configured in DB")
 
+    # Open the shared download client and start the OCR workers up front
+    get_http_client()
+    await start_ocr_pool()
+
     yield
     print("Application shutting down")
+    await close_http_client()
+    await ACTIVE_LLM.close()
+    shutdown_ocr_pool()
 
 
 app = FastAPI(
     title="Ginthi Invoice Reconciliation API's",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=MsgspecJSONResponse
 )
 
 
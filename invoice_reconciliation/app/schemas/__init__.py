@@ -1,2 +1,5 @@
 # Import all your Beanie models here
 from .llm_config import LLMConfig
+
+# Beanie document models registered with init_beanie
+DOCUMENT_MODELS = [LLMConfig]
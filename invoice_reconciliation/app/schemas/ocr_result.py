@@ -0,0 +1,34 @@
+from typing import Any, Dict, List, Optional
+
+import msgspec
+
+
+class PageImage(msgspec.Struct):
+    page_number: int
+    image_base64: str
+
+
+class PageResult(msgspec.Struct):
+    page_number: int
+    plain_text: str
+    structured_data: List[Dict[str, Any]]
+    key_value_pairs: Dict[str, Any]
+    tables: List[Any]
+    page_image_index: int
+    resolution_multiplier: float
+
+
+class DocumentResult(msgspec.Struct, kw_only=True, omit_defaults=True):
+    success: bool
+    source_url: str
+    file_type: str
+    plain_text: str
+    structured_data: List[Dict[str, Any]]
+    key_value_pairs: Dict[str, Any]
+    tables: List[Any]
+    original_image_base64: Optional[str]
+    # PDF only; left out of image responses
+    all_page_images: Optional[List[PageImage]] = None
+    pages_data: Optional[List[PageResult]] = None
+    metadata: Dict[str, Any]
+
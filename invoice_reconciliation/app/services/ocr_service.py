@@ -1,22 +1,57 @@
+import asyncio
 import logging
 import os
+from functools import lru_cache
 from urllib.parse import urlparse
-from PIL import Image
-import cv2
-from typing import Dict, Any
+import numpy as np
+from typing import Dict, Any, List, Awaitable, Callable, Tuple, Union
 
 from app.core.ocr.ocr_helpers import test_tesseract, create_error_response
 from app.core.ocr.image_processor import (
     download_image_from_url, 
     download_pdf_from_url, 
-    preprocess_image_advanced, 
-    image_to_base64,
-    process_pdf_pages
+    decode_image,
+    image_to_base64_np,
+    iter_pdf_pages,
+    OCR_TARGET_LONG_EDGE_PX,
+    PDF_PAGE_IMAGE_FORMAT,
+    PDF_PAGE_JPEG_QUALITY
 )
-from app.core.ocr.text_extractor import extract_all_data_advanced
+from app.core.ocr.ocr_cache import (
+    content_key,
+    get_cached_result,
+    cache_result,
+    page_cache_key,
+    get_page_result,
+    cache_page_result
+)
+from app.core.ocr.text_extractor import extract_all_data_from_text_layer
+from app.core.ocr.ocr_pool import get_ocr_pool, ocr_image, OCR_POOL_WORKERS
+from app.utils.batch_queue import AsyncBatchQueue
+from app.schemas.ocr_result import DocumentResult, PageImage, PageResult
 
 logger = logging.getLogger(__name__)
 
+OCR_BATCH_WAIT_MS = float(os.getenv('OCR_BATCH_WAIT_MS', '50'))
+# Rendered pages waiting for OCR; bounds PDF memory to a few pages at a time
+PDF_PAGE_BUFFER_SIZE = int(os.getenv('OCR_PDF_PAGE_BUFFER', '4'))
+
+
+async def _ocr_image_batch(images: List[np.ndarray]) -> List[Any]:
+    """OCR a batch of images across the shared process pool; failures are returned per image"""
+    loop = asyncio.get_running_loop()
+    pool = get_ocr_pool()
+    return await asyncio.gather(
+        *(loop.run_in_executor(pool, ocr_image, image) for image in images),
+        return_exceptions=True
+    )
+
+
+@lru_cache(maxsize=2048)
+def _url_ext(url: str) -> str:
+    """Lower-cased file extension of a URL's path, cached since clients resubmit the same URLs"""
+    return os.path.splitext(urlparse(url).path)[1].lower()
+
 
 class OCRService:
     """
@@ -28,9 +63,30 @@ class OCRService:
         """Initialize OCR service with advanced configurations"""
         # Test Tesseract installation
         test_tesseract()
+        # Coalesce concurrent image requests into batches for the shared OCR pool
+        self._image_queue = AsyncBatchQueue(
+            _ocr_image_batch,
+            max_batch_size=OCR_POOL_WORKERS,
+            max_wait_ms=OCR_BATCH_WAIT_MS
+        )
+        # Processors by URL extension; anything else is treated as an image
+        self._processors = {'.pdf': self._process_pdf_from_url}
         logger.info("Advanced OCR Service initialized successfully")
     
-    async def process_document_from_url(self, url: str) -> Dict[str, Any]:
+    async def _ocr_cached(
+        self,
+        image: np.ndarray,
+        ocr: Callable[[np.ndarray], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Run `ocr` on an image unless a pixel-identical page was extracted recently"""
+        key = await asyncio.to_thread(page_cache_key, image)
+        extraction_result = get_page_result(key)
+        if extraction_result is None:
+            extraction_result = await ocr(image)
+            cache_page_result(key, extraction_result)
+        return extraction_result
+    
+    async def process_document_from_url(self, url: str) -> Union[DocumentResult, Dict[str, Any]]:
         """
         Main method to process document from URL with advanced analysis
         
@@ -38,23 +94,18 @@ class OCRService:
             url: Document URL (image or PDF)
             
         Returns:
-            Dictionary with extracted data and original image
+            DocumentResult with extracted data and original image, or an error response dict
         """
         try:
             # Determine file type
-            parsed_url = urlparse(url)
-            file_extension = os.path.splitext(parsed_url.path)[1].lower()
-            
-            if file_extension == '.pdf':
-                return await self._process_pdf_from_url(url)
-            else:
-                return await self._process_image_from_url(url)
+            processor = self._processors.get(_url_ext(url), self._process_image_from_url)
+            return await processor(url)
                 
         except Exception as e:
             logger.error(f"Error processing document from URL {url}: {str(e)}")
             return create_error_response(f"Error processing document: {str(e)}")
     
-    async def _process_image_from_url(self, url: str) -> Dict[str, Any]:
+    async def _process_image_from_url(self, url: str) -> Union[DocumentResult, Dict[str, Any]]:
         """
         Process single image document from URL with advanced preprocessing
         
@@ -62,41 +113,131 @@ class OCRService:
             url: Image URL
             
         Returns:
-            Dictionary with extracted data
+            DocumentResult with extracted data, or an error response dict
         """
         try:
-            # Download original image
-            original_image = download_image_from_url(url)
-            pil_image = Image.fromarray(cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB))
-            original_image_b64 = image_to_base64(pil_image)
-            processed_image = preprocess_image_advanced(pil_image)
-            extraction_result = extract_all_data_advanced(pil_image, processed_image)
+            # Download original image and short-circuit on previously seen content
+            image_content = await download_image_from_url(url)
+            cache_key = content_key("image", image_content)
+            cached = await get_cached_result(cache_key, url)
+            if cached is not None:
+                return cached
+            
+            # One BGR array feeds both the encoder and OCR, with no PIL round trip
+            original_image = decode_image(image_content)
+            height, width = original_image.shape[:2]
             
-            result = {
-                "success": True,
-                "source_url": url,
-                "file_type": "image",
-                "plain_text": extraction_result["plain_text"],
-                "structured_data": extraction_result["structured_data"],
-                "key_value_pairs": extraction_result["key_value_pairs"],
-                "tables": extraction_result["tables"],
-                "original_image_base64": original_image_b64,
-                "metadata": {
+            # Keep CPU-bound work off the event loop; encode while the image is being OCR'd
+            original_image_b64, extraction_result = await asyncio.gather(
+                asyncio.to_thread(image_to_base64_np, original_image),
+                self._ocr_cached(original_image, self._image_queue.submit)
+            )
+            
+            result = DocumentResult(
+                success=True,
+                source_url=url,
+                file_type="image",
+                plain_text=extraction_result["plain_text"],
+                structured_data=extraction_result["structured_data"],
+                key_value_pairs=extraction_result["key_value_pairs"],
+                tables=extraction_result["tables"],
+                original_image_base64=original_image_b64,
+                metadata={
                     "image_dimensions": {
-                        "width": pil_image.width,
-                        "height": pil_image.height
+                        "width": width,
+                        "height": height
                     },
                     "processing_info": extraction_result["metadata"]
                 }
-            }
+            )
             
+            await cache_result(cache_key, result, [extraction_result])
             return result
             
         except Exception as e:
             logger.error(f"Error processing image from URL {url}: {str(e)}")
             return create_error_response(f"Error processing image: {str(e)}")
     
-    async def _process_pdf_from_url(self, url: str) -> Dict[str, Any]:
+    async def _ocr_pdf_pages(self, pdf_content: bytes) -> List[Tuple[int, float, str, Dict[str, Any]]]:
+        """
+        Rasterize PDF pages and OCR them as they are rendered
+        
+        Returns:
+            (page number, render scale, page image base64, extraction result) per page, in page order
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_ocr_pool()
+        # Pages are rendered on the same long-lived pool that OCRs them
+        pages = iter_pdf_pages(pdf_content, executor=pool)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PDF_PAGE_BUFFER_SIZE)
+        results = {}
+        errors = []
+        
+        async def produce() -> None:
+            # The producer owns the page generator: only it advances it, and it closes it once no thread is inside it
+            step = None
+            cancelled = False
+            try:
+                # Once a page has failed the document has failed; render nothing more
+                while not errors:
+                    # Shielded so cancellation can't return while the render thread is still inside the generator
+                    step = asyncio.ensure_future(asyncio.to_thread(next, pages, None))
+                    if (page_data := await asyncio.shield(step)) is None:
+                        break
+                    await queue.put(page_data)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+            finally:
+                if step is not None and not step.done():
+                    # Closing a generator another thread is executing raises ValueError
+                    await asyncio.wait([step])
+                # Cancels the renders still pending on the shared pool
+                pages.close()
+                # Cancelled consumers drain nothing, so sentinels would only block on a full queue
+                if not cancelled:
+                    for _ in range(OCR_POOL_WORKERS):
+                        await queue.put(None)
+        
+        async def consume() -> None:
+            while (page_data := await queue.get()) is not None:
+                if errors:
+                    continue
+                # Take the image out of the page entry so nothing else keeps it alive
+                image = page_data.pop('image')
+                text_layer = page_data.pop('text_layer')
+                try:
+                    if text_layer is not None:
+                        # Born-digital page: its text layer is exact, so skip preprocessing and OCR
+                        extract = asyncio.to_thread(
+                            extract_all_data_from_text_layer, text_layer['text'], text_layer['words']
+                        )
+                    else:
+                        extract = self._ocr_cached(image, lambda page_image: loop.run_in_executor(pool, ocr_image, page_image))
+                    # Encode while the page is being OCR'd
+                    page_image_b64, page_extraction = await asyncio.gather(
+                        asyncio.to_thread(image_to_base64_np, image, PDF_PAGE_IMAGE_FORMAT, PDF_PAGE_JPEG_QUALITY),
+                        extract
+                    )
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                finally:
+                    # Release the page's pixels now rather than when this consumer picks up its next page
+                    del image
+                page_num = page_data['page_number']
+                results[page_num] = (page_num, page_data['scale'], page_image_b64, page_extraction)
+        
+        outcomes = await asyncio.gather(
+            produce(), *(consume() for _ in range(OCR_POOL_WORKERS)),
+            return_exceptions=True
+        )
+        errors.extend(outcome for outcome in outcomes if isinstance(outcome, Exception))
+        if errors:
+            raise errors[0]
+        return [results[page_num] for page_num in sorted(results)]
+    
+    async def _process_pdf_from_url(self, url: str) -> Union[DocumentResult, Dict[str, Any]]:
         """
         Process PDF document from URL with advanced analysis
         
@@ -104,89 +245,84 @@ class OCRService:
             url: PDF URL
             
         Returns:
-            Dictionary with extracted data from all pages
+            DocumentResult with extracted data from all pages, or an error response dict
         """
         try:
             # Download PDF
-            pdf_content = download_pdf_from_url(url)
+            pdf_content = await download_pdf_from_url(url)
+            cache_key = content_key("pdf", pdf_content)
+            cached = await get_cached_result(cache_key, url)
+            if cached is not None:
+                return cached
             
-            # Process PDF pages
-            pages_data_raw = process_pdf_pages(pdf_content)
+            # Rasterize and OCR pages as a stream
+            processed_pages = await self._ocr_pdf_pages(pdf_content)
             
             all_pages_data = []
-            combined_text = ""
+            combined_text_parts = []
             combined_tables = []
             combined_kv_pairs = {}
             combined_structured_data = []
             first_page_image_b64 = None
             all_page_images = []  # Store all page images
             
-            for page_data in pages_data_raw:
-                page_num = page_data['page_number']
-                pil_image = page_data['pil_image']
-                
-                # Convert current page to base64
-                page_image_b64 = image_to_base64(pil_image)
+            for page_num, scale, page_image_b64, page_extraction in processed_pages:
                 
                 # Store first page image for backward compatibility
                 if page_num == 1:
                     first_page_image_b64 = page_image_b64
                 
-                # Store all page images with page numbers
-                all_page_images.append({
-                    "page_number": page_num,
-                    "image_base64": page_image_b64
-                })
-                
-                # Preprocess image
-                processed_image = preprocess_image_advanced(pil_image)
-                
-                # Process page with advanced methods
-                page_extraction = extract_all_data_advanced(pil_image, processed_image)
+                # Store all page images with page numbers; this is the only copy of each page image
+                page_image_index = len(all_page_images)
+                all_page_images.append(PageImage(page_number=page_num, image_base64=page_image_b64))
                 
                 # Add page info to structured data
                 for item in page_extraction["structured_data"]:
                     item["page_number"] = page_num
                 
                 # Combine results
-                page_result = {
-                    "page_number": page_num,
-                    "plain_text": page_extraction["plain_text"],
-                    "structured_data": page_extraction["structured_data"],
-                    "key_value_pairs": page_extraction["key_value_pairs"],
-                    "tables": page_extraction["tables"],
-                    "page_image_base64": page_image_b64  # Include page image in each page data
-                }
+                page_result = PageResult(
+                    page_number=page_num,
+                    plain_text=page_extraction["plain_text"],
+                    structured_data=page_extraction["structured_data"],
+                    key_value_pairs=page_extraction["key_value_pairs"],
+                    tables=page_extraction["tables"],
+                    page_image_index=page_image_index,  # Index of this page's image in all_page_images
+                    resolution_multiplier=scale
+                )
                 all_pages_data.append(page_result)
                 
                 # Combine for overall document
-                combined_text += f"\n--- Page {page_num} ---\n" + page_extraction["plain_text"]
+                combined_text_parts.append(f"\n--- Page {page_num} ---\n{page_extraction['plain_text']}")
                 combined_tables.extend(page_extraction["tables"])
                 combined_kv_pairs.update(page_extraction["key_value_pairs"])
                 combined_structured_data.extend(page_extraction["structured_data"])
             
             # Prepare final response
-            result = {
-                "success": True,
-                "source_url": url,
-                "file_type": "pdf",
-                "plain_text": combined_text.strip(),
-                "structured_data": combined_structured_data,
-                "key_value_pairs": combined_kv_pairs,
-                "tables": combined_tables,
-                "original_image_base64": first_page_image_b64,  
-                "all_page_images": all_page_images, 
-                "pages_data": all_pages_data,
-                "metadata": {
-                    "total_pages": len(pages_data_raw),
+            result = DocumentResult(
+                success=True,
+                source_url=url,
+                file_type="pdf",
+                plain_text="".join(combined_text_parts).strip(),
+                structured_data=combined_structured_data,
+                key_value_pairs=combined_kv_pairs,
+                tables=combined_tables,
+                original_image_base64=first_page_image_b64,
+                all_page_images=all_page_images,
+                pages_data=all_pages_data,
+                metadata={
+                    "total_pages": len(processed_pages),
                     "processing_info": {
-                        "resolution_multiplier": 2.0,
+                        "resolution_multiplier": max((page.resolution_multiplier for page in all_pages_data), default=0.0),
+                        "target_long_edge_px": OCR_TARGET_LONG_EDGE_PX,
+                        "page_image_format": PDF_PAGE_IMAGE_FORMAT.lower(),
                         "pages_processed": len(all_pages_data),
                         "all_page_images_stored": len(all_page_images)
                     }
                 }
-            }
+            )
             
+            await cache_result(cache_key, result, [page[3] for page in processed_pages])
             return result
                 
         except Exception as e:
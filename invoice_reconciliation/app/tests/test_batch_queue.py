@@ -0,0 +1,73 @@
+import asyncio
+import time
+import unittest
+
+from app.utils.batch_queue import AsyncBatchQueue
+
+
+class AsyncBatchQueueTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_exception_result_fails_only_its_item(self):
+        async def process(items):
+            return [ValueError(f"bad {item}") if item % 2 else item * 10 for item in items]
+
+        queue = AsyncBatchQueue(process, max_batch_size=4, max_wait_ms=10)
+        results = await asyncio.gather(*(queue.submit(item) for item in range(4)), return_exceptions=True)
+
+        self.assertEqual(results[0], 0)
+        self.assertEqual(results[2], 20)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(str(results[3]), "bad 3")
+
+    async def test_raising_process_fn_fails_whole_batch(self):
+        async def process(items):
+            raise RuntimeError("pool broken")
+
+        queue = AsyncBatchQueue(process, max_batch_size=4, max_wait_ms=10)
+        results = await asyncio.gather(*(queue.submit(item) for item in range(3)), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    async def test_cancelled_dispatch_does_not_leave_callers_waiting(self):
+        started = asyncio.Event()
+
+        async def process(items):
+            started.set()
+            await asyncio.Event().wait()
+
+        queue = AsyncBatchQueue(process, max_batch_size=4, max_wait_ms=10)
+        submits = [asyncio.ensure_future(queue.submit(item)) for item in range(2)]
+        await started.wait()
+        for task in list(queue._inflight):
+            task.cancel()
+
+        results = await asyncio.wait_for(asyncio.gather(*submits, return_exceptions=True), timeout=1)
+        self.assertTrue(all(isinstance(result, asyncio.CancelledError) for result in results))
+
+    async def test_lone_item_is_not_held_for_the_batch_wait(self):
+        async def process(items):
+            return items
+
+        queue = AsyncBatchQueue(process, max_batch_size=4, max_wait_ms=2000)
+        start = time.monotonic()
+        self.assertEqual(await queue.submit("a"), "a")
+        self.assertLess(time.monotonic() - start, 1)
+
+    async def test_results_in_order_and_batches_bounded(self):
+        batch_sizes = []
+
+        async def process(items):
+            batch_sizes.append(len(items))
+            await asyncio.sleep(0.01)
+            return [item * 2 for item in items]
+
+        queue = AsyncBatchQueue(process, max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.gather(*(queue.submit(item) for item in range(10)))
+
+        self.assertEqual(results, [item * 2 for item in range(10)])
+        self.assertEqual(sum(batch_sizes), 10)
+        self.assertLessEqual(max(batch_sizes), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import random
+import re
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from app.core.ocr import data_parser
+from app.core.ocr.data_parser import (
+    KEY_PATTERNS,
+    group_word_indices_into_lines,
+    group_words_into_lines,
+    is_known_key
+)
+
+KEY_SAMPLES = [
+    '', 'invoice', 'invoice no', 'invoice  number', 'invoice#', 'bill #', 'billing address', 'bill to',
+    'tax', 'tax invoice', 'tax amount', 'taxable value', 'taxablevalue', 'gst', 'gstin', 'gstin no',
+    'pan', 'pan no', 'date', 'dated', 'due date', 'vendor name', 'supplier', 'company',
+    'grand total', 'final amount', 'final', 'qty', 'quantity', 'unit price', 'rate', 'hsn/sac',
+    'cgst', 'sgst @ 9%', 'igst', 'description', 'particulars', 'item code', 'ship to', 'consignee',
+    'p.o. number', 'remarks', 'signature', 'no', 'number',
+]
+
+KEY_FRAGMENTS = [
+    'invoice', 'bill', 'tax', 'taxable', 'no', 'number', '#', 'amount', 'value', 'gst', 'pan',
+    'date', 'total', 'qty', 'sac', 'item', 'name', 'ab', 'x', ' ', '  ', '/',
+]
+
+
+def _old_is_known_key(key):
+    """Key matching as originally written: one re.search per pattern"""
+    for pattern in KEY_PATTERNS:
+        if re.search(pattern, key, re.IGNORECASE):
+            return True
+    return False
+
+
+def _old_group_words_into_lines(words_data):
+    """Line grouping as originally written: a sorted scan comparing each word with the line's last word"""
+    if not words_data:
+        return []
+    sorted_words = sorted(words_data, key=lambda x: x['bbox']['top'])
+    lines = []
+    current_line = [sorted_words[0]]
+    for word in sorted_words[1:]:
+        if abs(word['bbox']['top'] - current_line[-1]['bbox']['top']) <= 10:
+            current_line.append(word)
+        else:
+            current_line.sort(key=lambda x: x['bbox']['left'])
+            lines.append(current_line)
+            current_line = [word]
+    current_line.sort(key=lambda x: x['bbox']['left'])
+    lines.append(current_line)
+    return lines
+
+
+def _random_words(rng, count):
+    """Words on a few jittered baselines, with repeated tops and lefts to exercise sort stability"""
+    baselines = [rng.randrange(0, 1500) for _ in range(rng.randint(1, 12))]
+    return [
+        {
+            'id': i,
+            'text': f"w{i}",
+            'bbox': {'top': rng.choice(baselines) + rng.randint(0, 14), 'left': rng.randrange(0, 1200, 40)}
+        }
+        for i in range(count)
+    ]
+
+
+def _key_corpus():
+    rng = random.Random(0)
+    generated = [''.join(rng.choice(KEY_FRAGMENTS) for _ in range(rng.randint(1, 4))) for _ in range(2000)]
+    return KEY_SAMPLES + generated
+
+
+class IsKnownKeyTest(unittest.TestCase):
+
+    @unittest.skipIf(data_parser.KEY_AUTOMATON is None, "pyahocorasick not installed")
+    def test_automaton_matches_pattern_loop(self):
+        for key in _key_corpus():
+            self.assertEqual(is_known_key(key), _old_is_known_key(key), repr(key))
+
+    def test_regex_fallback_matches_pattern_loop(self):
+        with mock.patch.object(data_parser, 'KEY_AUTOMATON', None):
+            for key in _key_corpus():
+                self.assertEqual(is_known_key(key), _old_is_known_key(key), repr(key))
+
+
+
+class GroupWordsIntoLinesTest(unittest.TestCase):
+
+    def test_matches_sorted_scan(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            words = _random_words(rng, rng.randint(1, 80))
+            expected = [[word['id'] for word in line] for line in _old_group_words_into_lines(words)]
+
+            tops = np.array([word['bbox']['top'] for word in words], dtype=np.int32)
+            lefts = np.array([word['bbox']['left'] for word in words], dtype=np.int32)
+            self.assertEqual([group.tolist() for group in group_word_indices_into_lines(tops, lefts)], expected)
+            self.assertEqual([[word['id'] for word in line] for line in group_words_into_lines(words)], expected)
+
+    def test_gap_at_tolerance_stays_on_line(self):
+        tops = np.array([100, 110, 121, 131], dtype=np.int32)
+        lefts = np.array([50, 10, 0, 30], dtype=np.int32)
+        self.assertEqual([group.tolist() for group in group_word_indices_into_lines(tops, lefts)], [[1, 0], [2, 3]])
+
+    def test_empty(self):
+        self.assertEqual(group_word_indices_into_lines(np.array([], dtype=np.int32), np.array([], dtype=np.int32)), [])
+        self.assertEqual(group_words_into_lines([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import tempfile
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+import diskcache
+import numpy as np
+from PIL import Image
+
+from app.core.ocr import ocr_cache, text_extractor
+from app.core.ocr.ocr_cache import cache_page_result, cache_result, content_key, get_cached_result, get_page_result
+from app.schemas.ocr_result import DocumentResult
+from app.core.ocr.text_extractor import OCR_FAILED_TEXT, OCR_TIMEOUT_TEXT, extract_all_data_advanced
+
+
+def _extraction(plain_text, **metadata):
+    return {
+        "plain_text": plain_text,
+        "structured_data": [],
+        "key_value_pairs": {},
+        "tables": [],
+        "metadata": metadata
+    }
+
+
+class PageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(ocr_cache, '_OCR_CACHE', OrderedDict())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_successful_extraction_is_served_as_a_copy(self):
+        cache_page_result("page", _extraction("Invoice No: 1"))
+
+        hit = get_page_result("page")
+        self.assertEqual(hit["plain_text"], "Invoice No: 1")
+        hit["key_value_pairs"]["mutated"] = "yes"
+        self.assertEqual(get_page_result("page")["key_value_pairs"], {})
+
+    def test_failed_or_empty_extraction_is_not_cached(self):
+        cache_page_result("error", _extraction("", error="boom"))
+        cache_page_result("empty", _extraction("  \n"))
+
+        self.assertIsNone(get_page_result("error"))
+        self.assertIsNone(get_page_result("empty"))
+
+    def test_ocr_fallback_placeholder_is_not_cached(self):
+        image = Image.new('L', (64, 64), 255)
+        for placeholder in (OCR_TIMEOUT_TEXT, OCR_FAILED_TEXT):
+            with mock.patch.object(text_extractor, 'extract_plain_text_advanced', return_value=(placeholder, None, None)):
+                result = extract_all_data_advanced(np.zeros((64, 64, 3), dtype=np.uint8), image)
+
+            self.assertEqual(result["metadata"]["error"], placeholder)
+            cache_page_result(placeholder, result)
+            self.assertIsNone(get_page_result(placeholder))
+
+
+
+class DocumentCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = diskcache.Cache(directory.name)
+        self.addCleanup(cache.close)
+        patcher = mock.patch.object(ocr_cache, '_cache', cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _round_trip(self, extractions):
+        key = content_key("pdf", b"%PDF-1.7 invoice")
+        result = DocumentResult(
+            success=True, source_url="http://a/invoice.pdf", file_type="pdf",
+            plain_text="\n".join(extraction["plain_text"] for extraction in extractions),
+            structured_data=[], key_value_pairs={}, tables=[], original_image_base64=None,
+            metadata={"total_pages": len(extractions)}
+        )
+        await cache_result(key, result, extractions)
+        return await get_cached_result(key, "http://b/retry.pdf")
+
+    async def test_successful_result_is_served_for_a_retry(self):
+        cached = await self._round_trip([_extraction("Invoice No: 1"), _extraction("")])
+
+        self.assertIsNotNone(cached)
+        self.assertEqual(cached.source_url, "http://b/retry.pdf")
+
+    async def test_failed_extraction_is_not_served_from_cache(self):
+        self.assertIsNone(await self._round_trip([_extraction("Invoice No: 1"), _extraction("", error="boom")]))
+        self.assertIsNone(await self._round_trip([_extraction(OCR_TIMEOUT_TEXT, error=OCR_TIMEOUT_TEXT)]))
+
+    async def test_result_without_text_is_not_served_from_cache(self):
+        self.assertIsNone(await self._round_trip([_extraction(""), _extraction(" ")]))
+
+
+if __name__ == '__main__':
+    unittest.main()
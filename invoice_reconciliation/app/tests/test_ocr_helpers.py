@@ -0,0 +1,56 @@
+import unittest
+
+from pytesseract.pytesseract import file_to_dict
+
+from app.core.ocr.ocr_helpers import TSV_HEADER, TSV_INT_COLUMNS, parse_tesseract_tsv
+
+COLUMNS = TSV_INT_COLUMNS + ('conf', 'text')
+
+# Page, block, paragraph and line rows carry no text; the CLI drops the trailing column for some of them
+TSV_ROWS = [
+    "1\t1\t0\t0\t0\t0\t0\t0\t1240\t1754\t-1",
+    "2\t1\t1\t0\t0\t0\t96\t120\t540\t40\t-1\t",
+    "3\t1\t1\t1\t0\t0\t96\t120\t540\t40\t-1",
+    "4\t1\t1\t1\t1\t0\t96\t120\t540\t40\t-1\t",
+    "5\t1\t1\t1\t1\t1\t96\t120\t150\t40\t96.5\tInvoice",
+    "5\t1\t1\t1\t1\t2\t260\t120\t60\t40\t91\tNo:",
+    "5\t1\t1\t1\t1\t3\t330\t121\t120\t39\t88.25\tINV-001",
+    "5\t1\t1\t1\t1\t4\t460\t121\t10\t39\t0",
+]
+
+
+class ParseTesseractTsvTest(unittest.TestCase):
+
+    def test_matches_pytesseract_output_dict(self):
+        # Rows missing only the text column at the end are what pytesseract's DICT parser handles too
+        rows = [row for row in TSV_ROWS if row.count('\t') == len(COLUMNS) - 1] + [TSV_ROWS[-1]]
+        tsv = '\n'.join([TSV_HEADER] + rows)
+        expected = file_to_dict(tsv, '\t', -1)
+
+        data = parse_tesseract_tsv(tsv)
+
+        for column in TSV_INT_COLUMNS + ('text',):
+            self.assertEqual(data[column], expected[column], column)
+        # pytesseract truncates the confidence to an int; the float is kept here
+        self.assertEqual([int(conf) for conf in data['conf']], expected['conf'])
+
+    def test_rows_missing_text_column_stay_aligned(self):
+        data = parse_tesseract_tsv('\n'.join([TSV_HEADER] + TSV_ROWS))
+
+        self.assertEqual({len(data[column]) for column in COLUMNS}, {len(TSV_ROWS)})
+        self.assertEqual(data['text'], ['', '', '', '', 'Invoice', 'No:', 'INV-001', ''])
+        self.assertEqual(data['level'], [1, 2, 3, 4, 5, 5, 5, 5])
+        self.assertEqual(data['conf'], [-1.0, -1.0, -1.0, -1.0, 96.5, 91.0, 88.25, 0.0])
+
+    def test_skips_truncated_rows(self):
+        data = parse_tesseract_tsv('\n'.join([TSV_HEADER, TSV_ROWS[4], "5\t1\t1", ""]))
+
+        self.assertEqual(data['text'], ['Invoice'])
+        self.assertEqual(data['left'], [96])
+
+    def test_empty_output(self):
+        self.assertEqual(parse_tesseract_tsv(''), {column: [] for column in COLUMNS})
+
+
+if __name__ == '__main__':
+    unittest.main()
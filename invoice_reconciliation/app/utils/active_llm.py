@@ -1,9 +1,37 @@
-from typing import Optional
+from typing import List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage, AIMessage
+from langchain.schema import HumanMessage
 from app.schemas.llm_config import LLMConfig
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
 import asyncio
+import httpx
+import os
+
+# Per-attempt timeout and attempt budget for LLM calls
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "15"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+# Upper bound on in-flight provider calls from invoke_batch, to stay within rate limits
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Threads reserved for the sync Gemini client, kept apart from the default executor
+LLM_GEMINI_WORKERS = int(os.getenv("LLM_GEMINI_WORKERS", "16"))
+
+
+def _is_transient_error(exc: BaseException) -> bool:
+    """
+    Classify errors worth retrying: timeouts, connection failures,
+    rate limiting (429) and provider-side 5xx errors.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        status = exc.code
+    return status == 429 or (isinstance(status, int) and 500 <= status < 600)
 
 
 class ActiveLLM:
@@ -19,7 +47,12 @@ class ActiveLLM:
             cls._instance = super().__new__(cls)
             cls._instance.llm = None
             cls._instance.llm_name = None
-            cls._instance.is_async = True
+            # Provider call and response-to-text extractor, bound once in init
+            cls._instance._call = None
+            cls._instance._extract = None
+            cls._instance.http_client = None
+            cls._instance.gemini_executor = None
+            cls._instance.semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
         return cls._instance
 
     async def init(self):
@@ -36,29 +69,49 @@ class ActiveLLM:
         provider = config.provider.lower()
 
         if provider == "openai":
+            if self.http_client is None:
+                # Pooled HTTP/2 client so TCP/TLS connections to the provider are reused across calls
+                self.http_client = httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+                )
             self.llm = ChatOpenAI(
                 openai_api_key=config.api_key,
                 temperature=0.2,
                 model_name=config.model_type or "gpt-3.5-turbo",
-                streaming=False
+                streaming=False,
+                http_async_client=self.http_client,
+                # Retries and backoff are left to _invoke_with_retry, so one attempt is one provider call
+                max_retries=0,
+                request_timeout=LLM_REQUEST_TIMEOUT
             )
             self.llm_name = "OpenAI"
-            self.is_async = True
+            self._call = self._call_async
 
         elif provider == "gemini":
+            if self.gemini_executor is None:
+                self.gemini_executor = ThreadPoolExecutor(
+                    max_workers=LLM_GEMINI_WORKERS, thread_name_prefix="gemini"
+                )
             self.llm = ChatGoogleGenerativeAI(
                 api_key=config.api_key,
                 model=config.model_type or "gemini-pro",
-                temperature=0.2
+                temperature=0.2,
+                # Retries and backoff are left to _invoke_with_retry, so one attempt is one provider call
+                max_retries=0,
+                # The client's own deadline is what frees a gemini thread when a call hangs
+                timeout=LLM_REQUEST_TIMEOUT
             )
             self.llm_name = "Google GenAI"
-            self.is_async = False  # Gemini client is sync
+            self._call = self._call_sync  # Gemini client is sync
         else:
             print(f"⚠️ Unsupported LLM provider: {provider}")
             self.llm = None
             self.llm_name = None
 
         if self.llm:
+            # Both providers are LangChain chat models, which always return an AIMessage
+            self._extract = attrgetter("content")
             print(f"✅ Active LLM initialized: {self.llm_name}")
 
     async def invoke(self, prompt: str) -> str:
@@ -69,22 +122,56 @@ class ActiveLLM:
         if not self.llm:
             raise ValueError("Active LLM not initialized")
 
-        message = HumanMessage(content=prompt)
+        return self._extract(await self._invoke_with_retry([HumanMessage(content=prompt)]))
 
-        if self.is_async:
-            response = await self.llm.ainvoke([message])
-        else:
-            # Run sync Gemini in a thread so it doesn’t block FastAPI loop
-            response = await asyncio.to_thread(self.llm.invoke, [message])
-
-        # Ensure we always return plain text
-        if isinstance(response, AIMessage):
-            return response.content
-        elif hasattr(response, "content"):
-            return response.content
-        elif hasattr(response, "text"):
-            return response.text
-        return str(response)
+    async def invoke_batch(self, prompts: List[str]) -> List[str]:
+        """
+        Send several prompts concurrently and return the responses in prompt order.
+        At most LLM_MAX_CONCURRENCY calls are in flight at once.
+        """
+        if not self.llm:
+            raise ValueError("Active LLM not initialized")
+
+        async def invoke_one(prompt: str) -> str:
+            async with self.semaphore:
+                response = await self._invoke_with_retry([HumanMessage(content=prompt)])
+            return self._extract(response)
+
+        return await asyncio.gather(*(invoke_one(prompt) for prompt in prompts))
+
+    async def close(self):
+        """Close the pooled provider HTTP client and the Gemini thread pool, if created."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        if self.gemini_executor is not None:
+            self.gemini_executor.shutdown(wait=False, cancel_futures=True)
+            self.gemini_executor = None
+
+    @retry(
+        stop=stop_after_attempt(LLM_MAX_ATTEMPTS),
+        wait=wait_exponential_jitter(initial=1, max=8),
+        retry=retry_if_exception(_is_transient_error),
+        reraise=True
+    )
+    async def _invoke_with_retry(self, messages: list):
+        """
+        Call the LLM with a per-attempt timeout.
+        Transient failures are retried with exponential backoff (1s, 2s, 4s... plus jitter).
+        """
+        return await asyncio.wait_for(self._call(messages), timeout=LLM_REQUEST_TIMEOUT)
+
+    def _call_async(self, messages: list):
+        return self.llm.ainvoke(messages)
+
+    def _call_sync(self, messages: list):
+        # Run sync Gemini on its own threads so it doesn’t block FastAPI loop
+        # or crowd out other work on the default executor.
+        # wait_for timing out only abandons the executor future: the thread stays busy until
+        # llm.invoke returns, which the client's own timeout (set in init) bounds.
+        return asyncio.get_running_loop().run_in_executor(
+            self.gemini_executor, self.llm.invoke, messages
+        )
 
 
 # Singleton instance to import anywhere
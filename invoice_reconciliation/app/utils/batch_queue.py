@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBatchQueue:
+    """
+    Coalesce items submitted by concurrent requests into small batches.
+    While fewer than `max_batch_size` items are being processed, items are
+    dispatched straight away (with whatever else is already queued). Once the
+    consumer is saturated, a batch is flushed when it holds `max_batch_size`
+    items or `max_wait_ms` after its first item arrived, whichever comes first.
+
+    `process_fn` receives the list of items and returns one result per item,
+    in order; an exception instance in place of a result fails only that item.
+    """
+
+    def __init__(
+        self,
+        process_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int,
+        max_wait_ms: float = 50
+    ):
+        self._process_fn = process_fn
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._collector: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._inflight_items = 0
+        self._capacity_freed = asyncio.Event()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[Any, asyncio.Future]]:
+        """Wait for a first item, then, while the consumer is saturated, gather more until the batch is full or the deadline passes"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        while len(batch) < self._max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        
+        # Only hold the batch back while the consumer is saturated; waiting otherwise just adds latency
+        deadline = loop.time() + self._max_wait
+        self._capacity_freed.clear()
+        while len(batch) < self._max_batch_size and self._inflight_items >= self._max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            getter = asyncio.ensure_future(self._queue.get())
+            freed = asyncio.ensure_future(self._capacity_freed.wait())
+            await asyncio.wait((getter, freed), timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            freed.cancel()
+            if getter.done():
+                batch.append(getter.result())
+            else:
+                getter.cancel()
+        return batch
+
+    async def _run(self) -> None:
+        """Collect batches forever, dispatching each without waiting for the previous one"""
+        while True:
+            batch = await self._collect_batch()
+            self._inflight_items += len(batch)
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Process one batch and resolve each caller's future"""
+        logger.info(f"Processing batch of {len(batch)} item(s)")
+        try:
+            results = await self._process_fn([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        except BaseException as e:
+            # Cancelled (e.g. at shutdown): settle the callers' futures, or every submit waiting on them hangs
+            for _, future in batch:
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            raise
+        finally:
+            self._inflight_items -= len(batch)
+            if self._inflight_items < self._max_batch_size:
+                self._capacity_freed.set()
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue  # caller went away
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,34 @@
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared outbound HTTP client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        # Shared client so TCP/TLS connections are reused across downloads
+        _client = httpx.AsyncClient(
+            http2=True,
+            headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            },
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            follow_redirects=True
+        )
+        logger.info("Shared HTTP client created")
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client and its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
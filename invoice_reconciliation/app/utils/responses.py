@@ -0,0 +1,27 @@
+from typing import Any
+
+import msgspec
+import numpy as np
+from fastapi.responses import JSONResponse
+
+
+def _enc_hook(obj: Any) -> Any:
+    # NumPy scalars can leak in from the OCR word arrays
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise NotImplementedError(f"Cannot encode objects of type {type(obj)}")
+
+
+_encoder = msgspec.json.Encoder(enc_hook=_enc_hook)
+
+
+def encode_json(content: Any) -> bytes:
+    """Encode dicts, lists and msgspec Structs to JSON bytes with msgspec's C encoder"""
+    return _encoder.encode(content)
+
+
+class MsgspecJSONResponse(JSONResponse):
+    """JSONResponse rendered with msgspec instead of the stdlib json module"""
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)